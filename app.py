@@ -1,77 +1,190 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, request
 from flask_cors import CORS
 import os
+import sys
+import hashlib
 import tempfile
-import subprocess
-import json
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import process_data
+
+logger = logging.getLogger(__name__)
+
+# Uploads larger than this are rejected with 413 before any of the body is read
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+
+class UploadRequest(Request):
+    """Request that streams file uploads into named temp files
+    
+    The analysis pool reads the upload by path, so it is written to disk once
+    and never copied; the file is deleted when Flask closes the request.
+    """
+    
+    # The analyze form carries a single file, so refuse multipart bodies
+    # padded with many extra parts before parsing them
+    max_form_parts = 16
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.NamedTemporaryFile(mode='w+b', suffix='.csv')
 
 app = Flask(__name__)
-CORS(app)
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+# Let browsers cache CORS preflight responses for a day
+CORS(app, max_age=86400)
+
+def make_json_response(data: bytes, status: int = 200):
+    """Wrap pre-encoded JSON bytes in a response, bypassing Flask's encoder"""
+    return Response(data, status=status, mimetype='application/json')
+
+def error_response(message: str, status: int):
+    """Build a JSON error response in the shape the frontend expects"""
+    return make_json_response(process_data.dumps_json({"error": message}), status)
+
+# LRU cache of encoded analysis results keyed by the SHA-256 of the upload,
+# so repeated uploads of the same file skip the analysis entirely
+RESULT_CACHE_SIZE = 64
+_RESULT_CACHE = OrderedDict()
+_RESULT_CACHE_LOCK = threading.Lock()
+
+def hash_upload(stream):
+    """Return the SHA-256 digest of an upload stream and rewind it"""
+    if hasattr(hashlib, 'file_digest'):
+        digest = hashlib.file_digest(stream, 'sha256').digest()
+    else:
+        h = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(1 << 16), b''):
+            h.update(chunk)
+        digest = h.digest()
+    stream.seek(0)
+    return digest
+
+def get_cached_result(key):
+    """Return the cached response body for an upload digest, if any"""
+    with _RESULT_CACHE_LOCK:
+        body = _RESULT_CACHE.get(key)
+        if body is not None:
+            _RESULT_CACHE.move_to_end(key)
+        return body
+
+def cache_result(key, body):
+    """Store a response body, evicting the least recently used entry when full"""
+    with _RESULT_CACHE_LOCK:
+        _RESULT_CACHE[key] = body
+        _RESULT_CACHE.move_to_end(key)
+        if len(_RESULT_CACHE) > RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+
+# Analyses run in a process pool so a worker thread can keep receiving uploads
+# while one is crunched. gunicorn already runs one worker per core, so each
+# worker's pool defaults to a single process. Pool processes are spawned rather
+# than forked, since forking a multi-threaded gthread worker isn't safe.
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 1))
+_ANALYSIS_POOL = None
+_ANALYSIS_POOL_LOCK = threading.Lock()
+
+def get_analysis_pool():
+    """Return the shared analysis process pool, creating it on first use"""
+    global _ANALYSIS_POOL
+    with _ANALYSIS_POOL_LOCK:
+        if _ANALYSIS_POOL is None:
+            _ANALYSIS_POOL = ProcessPoolExecutor(
+                max_workers=ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _ANALYSIS_POOL
+
+def reset_analysis_pool(pool):
+    """Drop a broken pool so the next get_analysis_pool() call starts a fresh one"""
+    global _ANALYSIS_POOL
+    with _ANALYSIS_POOL_LOCK:
+        if _ANALYSIS_POOL is pool:
+            _ANALYSIS_POOL = None
+    pool.shutdown(wait=False)
+
+def run_analysis(path):
+    """Run analyze_upload in the pool, retrying once on a fresh pool if a worker died
+    
+    A worker killed mid-analysis (e.g. by the OOM killer) breaks the whole pool,
+    failing every request in flight, not just the one that caused it.
+    """
+    for attempt in range(2):
+        pool = get_analysis_pool()
+        try:
+            return pool.submit(analyze_upload, path).result()
+        except BrokenProcessPool:
+            logger.warning("Analysis pool broke, starting a new one")
+            reset_analysis_pool(pool)
+            if attempt:
+                raise
+
+def analyze_upload(path):
+    """Pool entry point: analyze a CSV file and return (error, encoded JSON body)"""
+    result_data = process_data.process_data(path)
+    if "error" in result_data:
+        return result_data["error"], None
+    return None, process_data.dumps_json(result_data)
+
+# The status payload never changes, so encode it once at import
+_INDEX_BODY = process_data.dumps_json({"status": "API is running"})
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    # Werkzeug raises the same 413 for a multipart body with more than
+    # max_form_parts parts, or with a non-file field over max_form_memory_size.
+    # A body within the size limit can only have hit one of those
+    content_length = request.content_length
+    if content_length is not None and content_length <= MAX_UPLOAD_BYTES:
+        message = f"Too many form fields (maximum is {UploadRequest.max_form_parts})"
+        if request.max_form_memory_size is not None:
+            message += f" or a form field over {request.max_form_memory_size} bytes"
+        return error_response(message, 413)
+    return error_response(f"File too large (maximum size is {MAX_UPLOAD_BYTES} bytes)", 413)
 
 @app.route('/')
 def index():
-    return jsonify({"status": "API is running"})
+    return make_json_response(_INDEX_BODY)
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
     if 'file' not in request.files:
-        return jsonify({"error": "No file provided"}), 400
+        return error_response("No file provided", 400)
         
     file = request.files['file']
     if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
+        return error_response("No file selected", 400)
         
-    # Save file to a temporary location
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
-    file.save(temp_file.name)
-    temp_file.close()
-    
     try:
-        # Call the process_data.py script with the temporary file path
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "process_data.py")
-        result = subprocess.run(
-            ["python", script_path, temp_file.name], 
-            capture_output=True, 
-            text=True
-        )
+        # Serve repeated uploads of the same file from the result cache
+        upload_key = hash_upload(file.stream)
+        body = get_cached_result(upload_key)
+        if body is not None:
+            return make_json_response(body)
         
-        # Extract stdout and stderr
-        stdout = result.stdout
-        stderr = result.stderr
-        
-        # Clean up the temporary file
-        os.unlink(temp_file.name)
-        
-        # Log debug info from stderr
-        if stderr:
-            print("Python script debug info:", stderr)
-        
-        # Clean the stdout before parsing - extract only the JSON data
-        json_str = stdout.strip()
-        first_brace = json_str.find('{')
-        last_brace = json_str.rfind('}')
-        
-        if first_brace >= 0 and last_brace >= 0 and last_brace > first_brace:
-            json_str = json_str[first_brace:last_brace+1]
+        # The upload is already in a named temp file, so only its path is
+        # handed to the analysis pool; results come back already encoded so
+        # no large dict has to be pickled between processes
+        file.stream.flush()
+        error, body = run_analysis(file.stream.name)
             
-        # Parse the JSON data
-        result_data = json.loads(json_str)
-        
         # Check if the result contains an error
-        if "error" in result_data:
-            return jsonify({"error": result_data["error"]}), 500
+        if error is not None:
+            return error_response(error, 500)
             
-        return jsonify(result_data)
+        cache_result(upload_key, body)
+        return make_json_response(body)
         
     except Exception as e:
-        # Clean up the temporary file in case of error
-        try:
-            os.unlink(temp_file.name)
-        except:
-            pass
-        
-        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+        logger.exception("Error analyzing uploaded file")
+        return error_response(f"Internal server error: {str(e)}", 500)
 
 if __name__ == '__main__':
+    # Development server only; production runs gunicorn -c gunicorn_conf.py app:app
     port = int(os.environ.get('PORT', 5001))
-    app.run(host='0.0.0.0', port=port) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,19 @@
+"""Production server settings, used as: gunicorn -c gunicorn_conf.py app:app"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+
+# One process per core so CPU-bound analyses run in parallel, with threads
+# so uploads and cached responses don't wait behind a running analysis
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = 4
+keepalive = 5
+
+# Large analyses (forecasting in particular) can exceed the 30s default
+timeout = 120
+
+# Recycle workers periodically to bound memory growth from pandas
+max_requests = 1000
+max_requests_jitter = 100
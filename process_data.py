@@ -2,15 +2,34 @@ import sys
 import pandas as pd
 import numpy as np
 import json
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
 import traceback
 import datetime
 import warnings
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-# Suppress warnings
-warnings.filterwarnings('ignore')
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = None
+
+# Strings pd.read_csv treats as missing, so the pyarrow reader can match it
+try:
+    from pandas._libs.parsers import STR_NA_VALUES as _PANDAS_NA_VALUES
+except ImportError:
+    _PANDAS_NA_VALUES = {
+        '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+        '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null'
+    }
 
 load_dotenv()
 
@@ -21,6 +40,9 @@ def debug_print(message):
 # Custom JSON encoder to handle datetime objects
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
+        # Convert arrays in one bulk call (and before pd.isnull, which is elementwise on them)
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
         if pd.isnull(obj):
             return None
         if isinstance(obj, (pd.Timestamp, datetime.datetime, datetime.date)):
@@ -29,10 +51,78 @@ class CustomJSONEncoder(json.JSONEncoder):
             return int(obj)
         if isinstance(obj, np.floating):
             return float(obj)
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
         return super().default(obj)
 
+# Shared encoder instance so each serialization skips encoder construction
+_JSON_ENCODER = CustomJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+def dumps_json(data, indent=False):
+    """Serialize analysis results to JSON bytes, using orjson when it is installed
+    
+    orjson converts numpy arrays and scalars in C, so CustomJSONEncoder.default
+    is only called for the few values it can't handle natively (timestamps, NaT).
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(data, default=_JSON_ENCODER.default, option=option)
+        except TypeError as e:
+            debug_print(f"orjson could not serialize results, using json: {str(e)}")
+    if indent:
+        return json.dumps(data, cls=CustomJSONEncoder, indent=2, ensure_ascii=False).encode('utf-8')
+    return _JSON_ENCODER.encode(data).encode('utf-8')
+
+def read_csv(source):
+    """Read a CSV file, using pyarrow's multi-threaded parser when it is installed
+    
+    Files pyarrow would read differently from pd.read_csv (duplicate headers,
+    text that isn't valid UTF-8, integers beyond 64 bits) are handed to pandas.
+    """
+    if pa is not None:
+        try:
+            read_options = pa_csv.ReadOptions(use_threads=True, block_size=1 << 20)
+            # Treat the same strings as missing values as pd.read_csv does
+            convert_options = dict(null_values=list(_PANDAS_NA_VALUES), strings_can_be_null=True)
+            table = pa_csv.read_csv(
+                source,
+                read_options=read_options,
+                convert_options=pa_csv.ConvertOptions(**convert_options)
+            )
+            # pandas renames duplicate headers (a, a.1), pyarrow does not
+            if len(set(table.column_names)) != len(table.column_names):
+                raise ValueError("duplicate column names")
+            # Columns that aren't valid UTF-8 come back as raw bytes; let
+            # pandas read (and report) them instead
+            if any(pa.types.is_binary(f.type) or pa.types.is_large_binary(f.type) for f in table.schema):
+                raise ValueError("column is not valid UTF-8")
+            
+            # pyarrow infers dates and timestamps, pandas leaves them as text;
+            # re-read those columns as strings so downstream parsing is unchanged
+            temporal_columns = {f.name: pa.string() for f in table.schema if pa.types.is_temporal(f.type)}
+            if temporal_columns:
+                if hasattr(source, 'seek'):
+                    source.seek(0)
+                table = pa_csv.read_csv(
+                    source,
+                    read_options=read_options,
+                    convert_options=pa_csv.ConvertOptions(column_types=temporal_columns, **convert_options)
+                )
+            df = table.to_pandas()
+            # pyarrow turns integers that overflow int64 into floats, where
+            # pandas reads them as uint64 or keeps the text
+            for col in df.select_dtypes(include=[np.floating]).columns:
+                values = df[col].to_numpy()
+                if ((np.abs(values) >= 2.0 ** 63) & (values == np.round(values))).any():
+                    raise ValueError(f"column {col} has integers beyond int64")
+            return df
+        except Exception as e:
+            debug_print(f"pyarrow could not read the CSV, using pandas: {str(e)}")
+            if hasattr(source, 'seek'):
+                source.seek(0)
+    return pd.read_csv(source)
+
 def generate_basic_insights(stats):
     """Generate basic insights without using OpenAI API"""
     insights = []
@@ -55,10 +145,11 @@ def generate_basic_insights(stats):
     # Analyze correlations
     if stats['correlations']:
         insights.append("Correlation Analysis:")
-        for col1, correlations in stats['correlations'].items():
-            for col2, value in correlations.items():
-                if col1 < col2:  # Avoid duplicate correlations
-                    insights.append(f"- {col1} vs {col2}: {value:.2f}")
+        # Each distinct pair once, from the upper triangle of the matrix
+        columns = list(stats['correlations'])
+        for i, col1 in enumerate(columns):
+            for col2 in columns[i + 1:]:
+                insights.append(f"- {col1} vs {col2}: {stats['correlations'][col1][col2]:.2f}")
     
     # Add time series insights if available
     if 'time_patterns' in stats:
@@ -106,6 +197,41 @@ def generate_basic_insights(stats):
     
     return "\n".join(insights)
 
+# Values derived from a DataFrame (parsed datetimes, hours), keyed by id(df) so
+# every analysis of the same frame reuses them. Entries hold a weak reference
+# to guard against id reuse and are dropped when the frame is garbage collected.
+_FRAME_CACHE = {}
+
+def _frame_cache(df):
+    key = id(df)
+    entry = _FRAME_CACHE.get(key)
+    if entry is None or entry[0]() is not df or entry[1] != len(df):
+        entry = (weakref.ref(df), len(df), {})
+        _FRAME_CACHE[key] = entry
+        weakref.finalize(df, _FRAME_CACHE.pop, key, None)
+    return entry[2]
+
+def parse_datetimes(df):
+    """Parse the date_time column, reusing the result for the same DataFrame"""
+    if 'date_time' not in df.columns:
+        return None
+    cache = _frame_cache(df)
+    if 'datetimes' not in cache:
+        cache['datetimes'] = pd.to_datetime(df['date_time'], format='%d-%m-%Y %H:%M', errors='coerce', cache=True)
+    return cache['datetimes']
+
+def parse_hours(df):
+    """Hour of day for each row of the date_time column, cached like parse_datetimes"""
+    cache = _frame_cache(df)
+    if 'hours' not in cache:
+        cache['hours'] = parse_datetimes(df).dt.hour
+    return cache['hours']
+
+def count_unique_transactions(keys, transaction_codes):
+    """Count distinct transactions per key from pre-factorized transaction codes"""
+    pairs = pd.DataFrame({'key': keys, 'transaction': transaction_codes}).drop_duplicates()
+    return pairs.groupby('key').size().to_dict()
+
 def analyze_time_patterns(df):
     """Extract time-based patterns from date_time column"""
     time_patterns = {}
@@ -118,38 +244,40 @@ def analyze_time_patterns(df):
             return time_patterns
             
         # Convert date_time to datetime format
-        df_copy = df.copy()
-        df_copy['datetime'] = pd.to_datetime(df_copy['date_time'], format='%d-%m-%Y %H:%M', errors='coerce')
+        datetimes = parse_datetimes(df)
         
-        if df_copy['datetime'].isna().all():
+        if datetimes.isna().all():
             debug_print("Failed to parse date_time column")
             return time_patterns
             
-        # Extract hour, day, month
-        df_copy['hour'] = df_copy['datetime'].dt.hour
-        df_copy['day'] = df_copy['datetime'].dt.day_name()
-        df_copy['month'] = df_copy['datetime'].dt.month_name()
-        
-        # Hourly patterns (count of transactions by hour)
-        hourly_counts = df_copy.groupby('hour')['Transaction'].nunique().to_dict()
-        time_patterns['hourly'] = hourly_counts
+        # Factorize transactions once; every pattern below counts distinct codes
+        transaction_codes = pd.factorize(df['Transaction'])[0]
+        
+        # Hourly patterns (count of transactions by hour). Hours are 0-23, so
+        # encode each (hour, transaction) pair as one integer, dedupe and bincount
+        hours = parse_hours(df).to_numpy()
+        valid = ~np.isnan(hours) & (transaction_codes >= 0)
+        n_codes = transaction_codes.max() + 1
+        hour_transactions = np.unique(hours[valid].astype(np.int64) * n_codes + transaction_codes[valid])
+        hourly_counts = np.bincount(hour_transactions // n_codes, minlength=24)
+        time_patterns['hourly'] = {hour: int(count) for hour, count in enumerate(hourly_counts) if count}
         
         # Daily patterns (count of transactions by day of week)
-        daily_counts = df_copy.groupby('day')['Transaction'].nunique().to_dict()
+        daily_counts = count_unique_transactions(datetimes.dt.day_name(), transaction_codes)
         time_patterns['daily'] = daily_counts
         
         # Monthly patterns (count of transactions by month)
-        monthly_counts = df_copy.groupby('month')['Transaction'].nunique().to_dict()
+        monthly_counts = count_unique_transactions(datetimes.dt.month_name(), transaction_codes)
         time_patterns['monthly'] = monthly_counts
         
         # Weekday vs Weekend (if period_day exists)
-        if 'weekday_weekend' in df_copy.columns:
-            weekday_weekend = df_copy.groupby('weekday_weekend')['Transaction'].nunique().to_dict()
+        if 'weekday_weekend' in df.columns:
+            weekday_weekend = count_unique_transactions(df['weekday_weekend'], transaction_codes)
             time_patterns['weekday_weekend'] = weekday_weekend
             
         # Time of day patterns (if period_day exists)
-        if 'period_day' in df_copy.columns:
-            period_counts = df_copy.groupby('period_day')['Transaction'].nunique().to_dict()
+        if 'period_day' in df.columns:
+            period_counts = count_unique_transactions(df['period_day'], transaction_codes)
             time_patterns['period_day'] = period_counts
         
         debug_print(f"Time patterns extracted: {len(time_patterns)} categories")
@@ -160,6 +288,27 @@ def analyze_time_patterns(df):
     
     return time_patterns
 
+def _simple_ma_forecast(daily_sales, forecast_periods):
+    """Flat forecast at the moving average of the last week of daily sales"""
+    window_size = min(7, len(daily_sales))
+    ma = daily_sales.rolling(window=window_size).mean().iloc[-1]
+    
+    forecast_dates = [
+        (daily_sales.index[-1] + datetime.timedelta(days=i+1)).strftime('%Y-%m-%d') 
+        for i in range(forecast_periods)
+    ]
+    
+    debug_print("Sales forecast generated using simple moving average")
+    return {
+        'dates': forecast_dates,
+        'predicted': [int(ma)] * forecast_periods,
+        'lower_bound': [int(ma * 0.8)] * forecast_periods,
+        'upper_bound': [int(ma * 1.2)] * forecast_periods,
+        'trend': 0,
+        'seasonal_periods': 'not detected',
+        'peak_forecast_day': forecast_dates[0]
+    }
+
 def forecast_sales(df, forecast_periods=30):
     """Forecast future sales using time series modeling"""
     forecast_result = {}
@@ -171,15 +320,21 @@ def forecast_sales(df, forecast_periods=30):
             return forecast_result
             
         # Convert date_time to datetime and prepare data
-        df_copy = df.copy()
-        df_copy['datetime'] = pd.to_datetime(df_copy['date_time'], format='%d-%m-%Y %H:%M', errors='coerce')
+        datetimes = parse_datetimes(df)
         
-        if df_copy['datetime'].isna().all():
+        if datetimes.isna().all():
             debug_print("Failed to parse date_time column for forecasting")
             return forecast_result
             
-        # Create daily transaction counts
-        daily_sales = df_copy.groupby(df_copy['datetime'].dt.date)['Transaction'].nunique()
+        # Create daily transaction counts, keyed by datetime64 midnight rather
+        # than Python date objects so the grouping stays on the vectorized path
+        daily_sales = df['Transaction'].groupby(datetimes.dt.floor('D')).nunique()
+        
+        # Prophet and the seasonal model need at least two weeks of varying
+        # data, so don't pay for importing and fitting them when they would fail
+        if len(daily_sales) < 14 or daily_sales.std() == 0:
+            debug_print(f"Not enough daily data to fit a model ({len(daily_sales)} days), using simple moving average")
+            return _simple_ma_forecast(daily_sales, forecast_periods)
         
         # Try using Prophet if available
         try:
@@ -284,26 +439,7 @@ def forecast_sales(df, forecast_periods=30):
             except Exception as e:
                 debug_print(f"Error using statsmodels for forecasting: {str(e)}")
                 debug_print("Using very simple moving average for forecasting")
-                
-                # Very simple moving average
-                window_size = min(7, len(daily_sales))
-                ma = daily_sales.rolling(window=window_size).mean().iloc[-1]
-                
-                forecast_dates = [
-                    (daily_sales.index[-1] + datetime.timedelta(days=i+1)).strftime('%Y-%m-%d') 
-                    for i in range(forecast_periods)
-                ]
-                
-                forecast_result = {
-                    'dates': forecast_dates,
-                    'predicted': [int(ma)] * forecast_periods,
-                    'lower_bound': [int(ma * 0.8)] * forecast_periods,
-                    'upper_bound': [int(ma * 1.2)] * forecast_periods,
-                    'trend': 0,
-                    'seasonal_periods': 'not detected',
-                    'peak_forecast_day': forecast_dates[0]
-                }
-                debug_print("Sales forecast generated using simple moving average")
+                forecast_result = _simple_ma_forecast(daily_sales, forecast_periods)
     
     except Exception as e:
         debug_print(f"Error generating sales forecast: {str(e)}")
@@ -311,6 +447,18 @@ def forecast_sales(df, forecast_periods=30):
     
     return forecast_result
 
+def quintile_scores(values):
+    """Score values 1-5 by quintile like pd.qcut(values, q=5), with 0 for missing values"""
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    edges = np.quantile(values[~missing], np.linspace(0, 1, 6))
+    if len(np.unique(edges)) < len(edges):
+        raise ValueError(f"Bin edges must be unique: {edges.tolist()}")
+    # Bins are right-closed, with the lowest value falling in the first bin
+    scores = np.searchsorted(edges[1:-1], values, side='left') + 1
+    scores[missing] = 0
+    return scores
+
 def segment_customers(df):
     """Group customers by purchase behavior (RFM analysis)"""
     customer_segments = {}
@@ -321,28 +469,22 @@ def segment_customers(df):
             debug_print("Required columns for customer segmentation not found")
             return customer_segments
             
-        # Create a copy for processing
-        df_copy = df.copy()
-        
         # Convert date_time to datetime if available
-        if 'date_time' in df_copy.columns:
-            df_copy['datetime'] = pd.to_datetime(df_copy['date_time'], format='%d-%m-%Y %H:%M', errors='coerce')
-            today = df_copy['datetime'].max()
+        datetimes = parse_datetimes(df)
+        if datetimes is not None:
+            today = datetimes.max()
         else:
             debug_print("No date column found, using transaction count only for segmentation")
             today = pd.Timestamp.now()
         
         # Group by transaction (as a proxy for customer ID)
-        if 'datetime' in df_copy.columns:
-            rfm = df_copy.groupby('Transaction').agg({
-                'datetime': lambda x: (today - x.max()).days,  # Recency
-                'Item': 'count',                              # Frequency
-            }).rename(columns={
-                'datetime': 'recency',
-                'Item': 'frequency'
+        if datetimes is not None:
+            rfm = pd.DataFrame({
+                'recency': (today - datetimes.groupby(df['Transaction']).max()).dt.days,
+                'frequency': df.groupby('Transaction')['Item'].count(),
             })
         else:
-            rfm = df_copy.groupby('Transaction').agg({
+            rfm = df.groupby('Transaction').agg({
                 'Item': 'count',                              # Frequency
             }).rename(columns={
                 'Item': 'frequency'
@@ -350,25 +492,31 @@ def segment_customers(df):
             # Add dummy recency
             rfm['recency'] = 1
         
-        # Create RFM segments
-        rfm['R_score'] = pd.qcut(rfm['recency'], q=5, labels=[5, 4, 3, 2, 1])
-        rfm['F_score'] = pd.qcut(rfm['frequency'], q=5, labels=[1, 2, 3, 4, 5])
+        # Create RFM segments; the most recent customers get the highest R score
+        r_scores = quintile_scores(rfm['recency'])
+        r_scores = np.where(r_scores > 0, 6 - r_scores, 0)
+        f_scores = quintile_scores(rfm['frequency'])
+        rfm['R_score'] = r_scores
+        rfm['F_score'] = f_scores
         
-        # Calculate RFM Score and segment
-        rfm['RFM_score'] = rfm['R_score'].astype(str) + rfm['F_score'].astype(str)
+        # Calculate RFM Score as a two-digit integer code; only the final
+        # column is converted to strings
+        score_codes = r_scores * 10 + f_scores
+        rfm['RFM_score'] = score_codes.astype(str)
         
         # Define segments
         segments = {
-            'Champions': ['55', '54', '45'],
-            'Loyal': ['53', '52', '51', '44', '43', '42', '35', '34', '33'],
-            'Potential': ['41', '32', '31', '25', '24', '23'],
-            'New': ['15', '14', '13', '12', '11'],
-            'At Risk': ['50', '40', '30', '20', '10'],
+            'Champions': [55, 54, 45],
+            'Loyal': [53, 52, 51, 44, 43, 42, 35, 34, 33],
+            'Potential': [41, 32, 31, 25, 24, 23],
+            'New': [15, 14, 13, 12, 11],
+            'At Risk': [50, 40, 30, 20, 10],
             'Others': []
         }
         
-        # Map segments
-        rfm['segment'] = rfm['RFM_score'].apply(lambda x: next((k for k, v in segments.items() if x in v), 'Others'))
+        # Map segments through a flat score -> segment lookup
+        segment_map = {code: name for name, codes in segments.items() for code in codes}
+        rfm['segment'] = pd.Series(score_codes, index=rfm.index).map(segment_map).fillna('Others')
         
         # Create segment summary
         segment_counts = rfm['segment'].value_counts().to_dict()
@@ -394,41 +542,56 @@ def segment_customers(df):
     
     return customer_segments
 
-def analyze_product_associations(df, min_support=10):
-    """Find items frequently bought together"""
+def analyze_product_associations(df, min_support=10, item_counts=None):
+    """Find items frequently bought together
+    
+    item_counts may be passed in as df['Item'].value_counts() when the caller
+    has already computed it.
+    """
     try:
         if 'Item' not in df.columns or 'Transaction' not in df.columns:
             debug_print("Required columns not found for product association analysis")
             return {}
             
-        # Group items by transaction
-        transactions = df.groupby('Transaction')['Item'].apply(list).reset_index()
+        from scipy import sparse
         
         # Calculate item frequencies
-        item_counts = df['Item'].value_counts().to_dict()
-        
-        # Find items that occur together
-        associations = {}
+        if item_counts is None:
+            item_counts = df['Item'].value_counts()
         
         # Get list of items with count > min_support
-        popular_items = [item for item, count in item_counts.items() if count >= min_support]
+        # Limit to top 30 popular items to keep the response small
+        popular_items = [item for item, count in item_counts.items() if count >= min_support][:30]
+        
+        # Build a sparse (transaction x item) matrix of item counts in one pass;
+        # duplicate (transaction, item) pairs are summed on construction
+        trans_codes, trans_ids = pd.factorize(df['Transaction'])
+        item_codes, item_names = pd.factorize(df['Item'])
+        counts = sparse.csr_matrix(
+            (np.ones(len(df), dtype=np.int64), (trans_codes, item_codes)),
+            shape=(len(trans_ids), len(item_names))
+        )
+        presence = counts.copy()
+        presence.data[:] = 1
         
-        for item in popular_items[:30]:  # Limit to top 30 popular items for performance
-            # Find all transactions containing this item
-            item_transactions = transactions[transactions['Item'].apply(lambda x: item in x)]['Transaction'].tolist()
-            
-            # Get all other items in these transactions
-            related_items = {}
-            for trans_id in item_transactions:
-                items = df[df['Transaction'] == trans_id]['Item'].tolist()
-                for related_item in items:
-                    if related_item != item:
-                        related_items[related_item] = related_items.get(related_item, 0) + 1
-            
-            # Sort by frequency and keep top items
-            sorted_items = sorted(related_items.items(), key=lambda x: x[1], reverse=True)
-            if sorted_items:
-                associations[item] = sorted_items[:5]  # Keep top 5 associated items
+        # Co-occurrence for all popular items in one sparse product: row i counts
+        # how often each item appears in transactions containing popular item i
+        popular_codes = item_names.get_indexer(popular_items)
+        cooccurrence = (presence[:, popular_codes].T @ counts).toarray()
+        
+        associations = {}
+        for item, code, related in zip(popular_items, popular_codes, cooccurrence):
+            related[code] = 0  # An item is not associated with itself
+            related_codes = np.flatnonzero(related)
+            if len(related_codes) > 5:
+                # Only the items tied with or above the 5th highest count can
+                # make the top 5, found in linear time
+                fifth_count = np.partition(related[related_codes], -5)[-5]
+                related_codes = related_codes[related[related_codes] >= fifth_count]
+            if len(related_codes):
+                # Sort by frequency and keep top 5 associated items
+                top_codes = related_codes[np.argsort(-related[related_codes], kind='stable')[:5]]
+                associations[item] = [(item_names[j], int(related[j])) for j in top_codes]
         
         debug_print(f"Product associations found for {len(associations)} items")
         return associations
@@ -438,19 +601,50 @@ def analyze_product_associations(df, min_support=10):
         debug_print(traceback.format_exc())
         return {}
 
+def cramers_v(codes1, n_levels1, codes2, n_levels2):
+    """Bias-corrected Cramer's V between two factorized categorical columns"""
+    # Build the contingency table with one bincount over combined codes
+    valid = (codes1 >= 0) & (codes2 >= 0)
+    combined = codes1[valid] * n_levels2 + codes2[valid]
+    contingency = np.bincount(combined, minlength=n_levels1 * n_levels2).reshape(n_levels1, n_levels2)
+    contingency = contingency[contingency.any(axis=1)][:, contingency.any(axis=0)].astype(float)
+    
+    # Pearson chi-squared statistic, matching scipy's chi2_contingency
+    n = contingency.sum()
+    expected = contingency.sum(axis=1, keepdims=True) * contingency.sum(axis=0, keepdims=True) / n
+    r, k = contingency.shape
+    observed = contingency
+    if (r - 1) * (k - 1) == 1:
+        # Yates' continuity correction for 2x2 tables
+        diff = expected - observed
+        observed = observed + np.sign(diff) * np.minimum(0.5, np.abs(diff))
+    chi2 = ((observed - expected) ** 2 / expected).sum()
+    
+    phi2 = chi2 / n
+    phi2corr = max(0, phi2 - ((k-1)*(r-1))/(n-1))
+    rcorr = r - ((r-1)**2)/(n-1)
+    kcorr = k - ((k-1)**2)/(n-1)
+    return np.sqrt(phi2corr / min((kcorr-1), (rcorr-1)))
+
 def generate_correlation_matrix(df):
     """Generate correlation matrix for categorical variables"""
     try:
         if df.empty or len(df.columns) < 2:
             return {}
             
-        categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
+        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
         if len(categorical_cols) < 2:
             return {}
             
         # Select a subset of categorical columns to analyze
         selected_cols = categorical_cols[:4]  # Limit to first 4 to avoid too large matrix
         
+        # Factorize each column once so every pair reuses the integer codes
+        codes = {}
+        for col in selected_cols:
+            col_codes, uniques = pd.factorize(df[col])
+            codes[col] = (col_codes, len(uniques))
+        
         # Initialize matrix
         matrix = {}
         
@@ -463,19 +657,8 @@ def generate_correlation_matrix(df):
                 elif col2 in matrix and col1 in matrix[col2]:
                     matrix[col1][col2] = matrix[col2][col1]  # Symmetric
                 else:
-                    # Calculate contingency table
-                    contingency = pd.crosstab(df[col1], df[col2])
-                    # Calculate Cramer's V using scipy.stats
                     try:
-                        from scipy.stats import chi2_contingency
-                        chi2 = chi2_contingency(contingency)[0]
-                        n = contingency.sum().sum()
-                        phi2 = chi2 / n
-                        r, k = contingency.shape
-                        phi2corr = max(0, phi2 - ((k-1)*(r-1))/(n-1))
-                        rcorr = r - ((r-1)**2)/(n-1)
-                        kcorr = k - ((k-1)**2)/(n-1)
-                        cramer_v = np.sqrt(phi2corr / min((kcorr-1), (rcorr-1)))
+                        cramer_v = cramers_v(*codes[col1], *codes[col2])
                         matrix[col1][col2] = round(cramer_v, 3)
                     except Exception as e:
                         debug_print(f"Error calculating Cramer's V for {col1} and {col2}: {str(e)}")
@@ -489,8 +672,8 @@ def generate_correlation_matrix(df):
         debug_print(traceback.format_exc())
         return {}
 
-def detect_anomalies(df):
-    """Detect anomalies in the dataset"""
+def detect_anomalies(df, item_counts=None):
+    """Detect anomalies in the dataset, reusing item_counts (df['Item'].value_counts()) if given"""
     anomalies = {}
     
     try:
@@ -510,7 +693,7 @@ def detect_anomalies(df):
                 }
             
             # Unusual item frequency
-            item_frequency = df['Item'].value_counts()
+            item_frequency = item_counts if item_counts is not None else df['Item'].value_counts()
             rare_items = item_frequency[item_frequency == 1].index.tolist()
             if rare_items:
                 anomalies['rare_items'] = {
@@ -519,15 +702,9 @@ def detect_anomalies(df):
                 }
             
             # Time anomalies if datetime exists in the dataframe
-            df_copy = df.copy()
-            if 'date_time' in df_copy.columns:
-                # Convert date_time to datetime if it's not already processed
-                if 'datetime' not in df_copy.columns:
-                    df_copy['datetime'] = pd.to_datetime(df_copy['date_time'], format='%d-%m-%Y %H:%M', errors='coerce')
-                    df_copy['hour'] = df_copy['datetime'].dt.hour
-                
+            if 'date_time' in df.columns:
                 # Unusual hours - transactions outside business hours
-                hour_counts = df_copy['hour'].value_counts()
+                hour_counts = parse_hours(df).value_counts()
                 late_hours = [h for h in range(22, 24)] + [h for h in range(0, 6)]
                 unusual_hours = {str(hour): int(count) for hour, count in hour_counts.items() if hour in late_hours}
                 if unusual_hours:
@@ -544,6 +721,11 @@ def detect_anomalies(df):
     
     return anomalies
 
+# Threads used by generate_insights to run the analyses side by side. Off by
+# default: the web app already runs one analysis per pool process, and on a
+# single core the threads were slower than running the analyses in turn
+ANALYSIS_THREADS = int(os.environ.get('ANALYSIS_THREADS', 1))
+
 def generate_insights(df):
     debug_print("Generating insights for dataset")
     # Calculate basic statistics
@@ -556,22 +738,22 @@ def generate_insights(df):
     # Process numeric columns
     numeric_cols = df.select_dtypes(include=[np.number]).columns
     debug_print(f"Found {len(numeric_cols)} numeric columns: {list(numeric_cols)}")
-    for col in numeric_cols:
-        stats['numeric_columns'][col] = {
-            'mean': float(df[col].mean()),
-            'median': float(df[col].median()),
-            'std': float(df[col].std()),
-            'min': float(df[col].min()),
-            'max': float(df[col].max())
-        }
+    if len(numeric_cols):
+        # All five summaries for every numeric column in a single call
+        summary = df[numeric_cols].agg(['mean', 'median', 'std', 'min', 'max']).astype(float)
+        stats['numeric_columns'] = {col: summary[col].to_dict() for col in numeric_cols}
     
     # Process categorical columns
-    categorical_cols = df.select_dtypes(include=['object']).columns
+    categorical_cols = df.select_dtypes(include=['object', 'category']).columns
     debug_print(f"Found {len(categorical_cols)} categorical columns: {list(categorical_cols)}")
+    # Item counts are shared with the association and anomaly analyses
+    item_counts = df['Item'].value_counts() if 'Item' in df.columns else None
+    unique_counts = df[categorical_cols].nunique()
     for col in categorical_cols:
+        value_counts = item_counts if col == 'Item' else df[col].value_counts()
         stats['categorical_columns'][col] = {
-            'unique_values': int(df[col].nunique()),
-            'most_common': df[col].value_counts().index[0]
+            'unique_values': int(unique_counts[col]),
+            'most_common': value_counts.index[0]
         }
     
     # Calculate correlations between numeric columns
@@ -580,23 +762,33 @@ def generate_insights(df):
         corr_matrix = df[numeric_cols].corr()
         stats['correlations'] = corr_matrix.to_dict()
     
-    # Add time patterns analysis
-    stats['time_patterns'] = analyze_time_patterns(df)
-    
-    # Add product associations
-    stats['product_associations'] = analyze_product_associations(df)
+    # Concurrent readers share one frame, so give them a consolidated copy
+    # rather than the one left fragmented by the Item astype assignment
+    if ANALYSIS_THREADS > 1:
+        df = df.copy()
     
-    # Add categorical correlation matrix
-    stats['categorical_correlation'] = generate_correlation_matrix(df)
+    # Parse the shared datetime columns up front so the analyses below only
+    # read from the frame cache
+    if parse_datetimes(df) is not None:
+        parse_hours(df)
     
-    # Add anomaly detection
-    stats['anomalies'] = detect_anomalies(df)
-    
-    # Add sales forecasting
-    stats['forecast'] = forecast_sales(df)
-    
-    # Add customer segmentation
-    stats['customer_segments'] = segment_customers(df)
+    analyses = [
+        ('time_patterns', analyze_time_patterns),
+        ('product_associations', partial(analyze_product_associations, item_counts=item_counts)),
+        ('categorical_correlation', generate_correlation_matrix),
+        ('anomalies', partial(detect_anomalies, item_counts=item_counts)),
+        ('forecast', forecast_sales),
+        ('customer_segments', segment_customers),
+    ]
+    if ANALYSIS_THREADS > 1:
+        # The analyses are independent, so they can run concurrently
+        with ThreadPoolExecutor(max_workers=ANALYSIS_THREADS) as executor:
+            futures = [(key, executor.submit(analysis, df)) for key, analysis in analyses]
+            for key, future in futures:
+                stats[key] = future.result()
+    else:
+        for key, analysis in analyses:
+            stats[key] = analysis(df)
     
     # Try to generate GPT insights, fall back to basic insights if OpenAI fails
     debug_print("Attempting to generate GPT insights")
@@ -609,10 +801,13 @@ def generate_insights(df):
         }
 
     try:
+        # Imported here since the client library is slow to load and only
+        # needed when an API key is configured
+        from openai import OpenAI
         client = OpenAI()
         
         prompt = f"""Analyze this dataset and provide key insights. Here are the statistics:
-        {json.dumps(stats, indent=2, cls=CustomJSONEncoder)}
+        {dumps_json(stats, indent=True).decode('utf-8')}
         
         Please provide:
         1. Key trends and patterns
@@ -656,62 +851,82 @@ def generate_insights(df):
             'insights': generate_basic_insights(stats)
         }
 
-def process_data(file_path):
-    debug_print(f"Processing data from {file_path}")
+def process_data(source):
+    """Load a CSV file (path or file-like object) and return the analysis results as a dict"""
+    # Suppress warnings from the analysis libraries for this call only, so
+    # importing the module doesn't silence warnings in the web app
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return _process_data(source)
+
+def _process_data(source):
+    debug_print(f"Processing data from {getattr(source, 'name', source)}")
     try:
-        # Read the CSV file
-        df = pd.read_csv(file_path)
+        # Read the CSV file; paths and open file objects are both accepted
+        df = read_csv(source)
         debug_print(f"CSV file loaded with {len(df)} rows and {len(df.columns)} columns")
         
         # Basic data cleaning
         df = df.dropna()  # Remove rows with missing values
         debug_print(f"After dropping NA values: {len(df)} rows")
         
-        # Create a clean copy of the dataframe without added datetime columns
-        # This will be used for the sample data to prevent JSON serialization issues
-        df_clean = df.copy()
+        # Store text Items as a categorical so counts, crosstabs and factorizing
+        # work on integer codes instead of hashing strings; numeric Item codes
+        # stay numeric, as Transaction does
+        if 'Item' in df.columns and df['Item'].dtype == object:
+            df['Item'] = df['Item'].astype('category')
         
-        # Generate insights and statistics
+        # Generate insights and statistics; the analyses keep derived values in
+        # local Series and never add columns to df, so no defensive copy is needed
         analysis_results = generate_insights(df)
         
         # Limit the data to a maximum of 100 rows to prevent large responses
-        data_sample = df_clean.head(100).to_dict('records')
+        data_sample = df.head(100).to_dict('records')
         debug_print(f"Converted DataFrame to {len(data_sample)} records (limited to 100 rows)")
         
         # Get column names (only original columns)
-        columns = df_clean.columns.tolist()
+        columns = df.columns.tolist()
         debug_print(f"Columns: {columns}")
         
-        # Combine all results
-        results = {
+        debug_print("Processing completed successfully")
+        return {
             'data': data_sample,  # Limited to 100 rows
             'columns': columns,
             'insights': analysis_results['insights'],
             'statistics': analysis_results['statistics'],
             'total_rows': len(df)  # Include the total number of rows for reference
         }
-        
-        # Convert to JSON and print
-        debug_print("Converting results to JSON")
-        # Print ONLY the JSON data to stdout (this will be parsed by the API route)
-        print(json.dumps(results, cls=CustomJSONEncoder))
-        debug_print("Processing completed successfully")
     except Exception as e:
         debug_print(f"Error processing file: {str(e)}")
         debug_print(traceback.format_exc())
-        error_result = {
+        return {
             'error': f"Error processing file: {str(e)}",
             'data': [],
             'columns': [],
             'insights': '',
             'statistics': {}
         }
-        # Print the error JSON to stdout
-        print(json.dumps(error_result))
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         file_path = sys.argv[1]
-        process_data(file_path)
+        results = process_data(file_path)
+        # Encode the whole document first, so a serialization error produces
+        # an error document rather than truncated JSON on stdout
+        try:
+            output = dumps_json(results)
+        except Exception as e:
+            debug_print(f"Error serializing results: {str(e)}")
+            debug_print(traceback.format_exc())
+            output = dumps_json({
+                'error': f"Error serializing results: {str(e)}",
+                'data': [],
+                'columns': [],
+                'insights': '',
+                'statistics': {}
+            })
+        # Write ONLY the JSON data to stdout, as UTF-8 bytes whatever the
+        # terminal encoding
+        sys.stdout.buffer.write(output + b"\n")
     else:
         debug_print("Please provide a file path")